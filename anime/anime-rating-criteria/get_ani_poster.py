@@ -1,18 +1,43 @@
+import glob
+import hashlib
+import json
 import os
 import re
 import sys
-import requests
-from bs4 import BeautifulSoup
+
+# 共用的传输层位于上级目录 anime/bgm_transport.py
+ANIME_DIR = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.insert(0, ANIME_DIR)
+from bgm_transport import TransportConfig, TransportError, create_transport
 
 # --- 配置 ---
-MARKDOWN_FILE = 'index.md'
-OUTPUT_DIR = 'anime_posters_new' # 新的输出目录，避免与旧文件混淆
+MARKDOWN_GLOB = os.path.join(ANIME_DIR, '*', 'index.md') # 一次处理所有番剧页面
+# 各页面解析结果的缓存（已在 .gitignore 中忽略，键为相对 ANIME_DIR 的路径）
+CACHE_FILE = os.path.join(ANIME_DIR, '.poster_index_cache.json')
+CACHE_VERSION = 2
 API_URL_TEMPLATE = 'https://api.bgm.tv/v0/subjects/{}/image?type=common'
 HEADERS = {
     'User-Agent': 'MyAnimePosterDownloader/1.1 (https://github.com/ienone)'
 }
+PROXY = None # 代理地址，如 'http://127.0.0.1:7890'
+TRANSPORT_BACKEND = 'httpx' # 'httpx' (HTTP/2 多路复用，未安装时自动回退) / 'requests' / 'stub' (测试用)
+MAX_CONNECTIONS = 4
 # --- 配置结束 ---
 
+# 逐行扫描时识别的标记：div 开闭标签、<img> 的 src、Bangumi 条目链接、小节标题
+TOKEN_RE = re.compile(
+    r'(?P<div_open><div\b(?P<div_attrs>[^>]*)>)'
+    r'|(?P<div_close></div\s*>)'
+    r'|(?P<img><img\b[^>]*?\bsrc=(?:"(?P<src1>[^"]*)"|\'(?P<src2>[^\']*)\'|(?P<src3>[^\s>]+)))'
+    r'|(?P<link>bgm\.tv/subject/(?P<subject_id>\d+))'
+    r'|(?P<heading><h3\b|^###\s)',
+    re.MULTILINE
+)
+CLASS_RE = re.compile(r'\bclass=(?:"(?P<cls1>[^"]*)"|\'(?P<cls2>[^\']*)\'|(?P<cls3>[^\s>]+))')
+# 行尾尚未闭合的标签开头，需要与下一行拼接后再匹配
+UNFINISHED_TAG_RE = re.compile(r'<[a-zA-Z/][^<>]*$')
+MAX_CARRY = 4096
+
 def sanitize_filename(filename):
     """移除文件名中的非法字符，虽然从src提取的一般是安全的，但以防万一。"""
     return re.sub(r'[\\/*?:"<>|]', "", filename).strip()
@@ -27,78 +52,181 @@ def setup_directory(dir_name):
             print(f"❌ 创建目录 '{dir_name}' 失败: {e}")
             sys.exit(1)
 
-def parse_and_download():
-    """解析 Markdown 文件并下载所有番剧图片"""
+def is_card_class(class_value):
+    """番剧卡片容器同时带有 border 和 rounded-lg 类"""
+    classes = class_value.split()
+    return 'border' in classes and 'rounded-lg' in classes
+
+def extract_posters(path):
+    """流式扫描页面，返回 (sha1, [(subject_id, 图片 src), ...])
+
+    不构建文档树，逐行匹配卡片开头、<img> 和条目链接；跨行的标签会拼接到下一行再匹配。
+    一个卡片内先后找到图片和链接（顺序不限）即记录一对；卡片的 div 闭合或遇到下一个
+    小节标题时，未凑齐的卡片被跳过并给出警告。"""
+    sha1 = hashlib.sha1()
+    posters = []
+    in_card, depth, subject_id, src = False, 0, None, None
+    carry = ''
+
+    def skip_card():
+        print(f"⚠️ 警告: 发现一个卡片，但无法提取链接或图片标签，已跳过。 ({path})")
+
+    with open(path, 'rb') as f:
+        for raw_line in f:
+            sha1.update(raw_line)
+            text = carry + raw_line.decode('utf-8', errors='replace')
+            unfinished = UNFINISHED_TAG_RE.search(text)
+            if unfinished and len(text) - unfinished.start() <= MAX_CARRY:
+                text, carry = text[:unfinished.start()], text[unfinished.start():]
+            else:
+                carry = ''
+            for match in TOKEN_RE.finditer(text):
+                if match.group('div_open'):
+                    class_match = CLASS_RE.search(match.group('div_attrs'))
+                    class_value = next((v for v in class_match.groups() if v is not None), '') if class_match else ''
+                    if is_card_class(class_value):
+                        if in_card:
+                            skip_card()
+                        in_card, depth, subject_id, src = True, 1, None, None
+                    elif in_card:
+                        depth += 1
+                elif not in_card:
+                    continue
+                elif match.group('heading'):
+                    skip_card()
+                    in_card = False
+                elif match.group('div_close'):
+                    depth -= 1
+                    if depth == 0:
+                        skip_card()
+                        in_card = False
+                elif match.group('img') and src is None:
+                    src = next(v for v in (match.group('src1'), match.group('src2'), match.group('src3')) if v is not None)
+                elif match.group('link') and subject_id is None:
+                    subject_id = match.group('subject_id')
+
+                if in_card and subject_id and src:
+                    posters.append((subject_id, src))
+                    in_card, subject_id, src = False, None, None
+    if in_card:
+        skip_card()
+    return sha1.hexdigest(), posters
+
+def load_cache():
     try:
-        with open(MARKDOWN_FILE, 'r', encoding='utf-8') as f:
-            content = f.read()
-    except FileNotFoundError:
-        print(f"❌ 错误: 未找到文件 '{MARKDOWN_FILE}'。请确保脚本和该文件在同一目录下。")
-        sys.exit(1)
-
-    soup = BeautifulSoup(content, 'lxml')
-    
-    anime_cards = soup.find_all('div', class_=re.compile(r'flex.*border.*rounded-lg'))
-    
-    if not anime_cards:
-        print("⚠️ 警告: 在文件中未找到任何番剧卡片。请检查 HTML 结构是否正确。")
+        with open(CACHE_FILE, 'r', encoding='utf-8') as f:
+            cache = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+    return cache.get('pages', {}) if cache.get('version') == CACHE_VERSION else {}
+
+def save_cache(pages):
+    with open(CACHE_FILE, 'w', encoding='utf-8') as f:
+        json.dump({'version': CACHE_VERSION, 'pages': pages}, f, ensure_ascii=False, indent=1)
+
+def file_sha1(path):
+    sha1 = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 16), b''):
+            sha1.update(chunk)
+    return sha1.hexdigest()
+
+def get_page_posters(path, cache):
+    """获取页面中的 (subject_id, 图片 src) 列表，按 mtime 与内容哈希命中缓存。
+    返回 (posters, changed)，changed 表示缓存条目有更新、需要写回"""
+    key = os.path.relpath(path, ANIME_DIR).replace(os.sep, '/')
+    stat = os.stat(path)
+    entry = cache.get(key)
+    if entry and entry['mtime_ns'] == stat.st_mtime_ns and entry['size'] == stat.st_size:
+        return [tuple(pair) for pair in entry['posters']], False
+    # mtime 变化但内容未变（如 git checkout）时只需计算哈希，无需重新解析
+    if entry and entry['size'] == stat.st_size and entry['sha1'] == file_sha1(path):
+        entry['mtime_ns'] = stat.st_mtime_ns
+        return [tuple(pair) for pair in entry['posters']], True
+    sha1, posters = extract_posters(path)
+    cache[key] = {'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size, 'sha1': sha1, 'posters': posters}
+    return posters, True
+
+def resolve_poster_path(page, src):
+    """将 src 解析为页面目录下的本地路径；外部链接或指向 ANIME_DIR 之外的路径返回 None"""
+    if re.match(r'^[a-zA-Z][a-zA-Z0-9+.-]*:', src) or src.startswith('/'):
+        return None
+    src_dir, filename = os.path.split(src)
+    filepath = os.path.normpath(os.path.join(os.path.dirname(page), src_dir, sanitize_filename(filename)))
+    if not filename or not filepath.startswith(ANIME_DIR + os.sep):
+        return None
+    return filepath
+
+def parse_and_download(transport):
+    """解析所有番剧页面，把页面引用但本地缺失的海报下载到 src 指向的位置"""
+    pages = sorted(glob.glob(MARKDOWN_GLOB))
+    if not pages:
+        print(f"❌ 错误: 未找到任何匹配 '{MARKDOWN_GLOB}' 的文件。")
+        return
+
+    cache = load_cache()
+    cache_changed = False
+    # subject_id -> [保存路径, ...]，同一条目在多个页面中出现时只下载一次
+    pending = {}
+    for page in pages:
+        posters, changed = get_page_posters(page, cache)
+        cache_changed |= changed
+        missing = []
+        for subject_id, src in posters:
+            filepath = resolve_poster_path(page, src)
+            if filepath is None:
+                print(f"⚠️ 警告: 无法解析图片路径 '{src}'，已跳过。 (ID: {subject_id})")
+            elif not os.path.exists(filepath):
+                missing.append((subject_id, filepath))
+        print(f"🔍 {os.path.relpath(page, ANIME_DIR)}: {len(posters)} 个番剧条目，{len(missing)} 张图片待下载")
+        for subject_id, filepath in missing:
+            setup_directory(os.path.dirname(filepath))
+            pending.setdefault(subject_id, []).append(filepath)
+    if cache_changed:
+        save_cache(cache)
+
+    if not pending:
+        print("✅ 所有海报均已存在，无需下载。")
         return
 
-    print(f"🔍 找到了 {len(anime_cards)} 个番剧条目，开始处理...")
-    
-    for card in anime_cards:
-        # 寻找包含 subject ID 的链接
-        link_tag = card.find('a', href=re.compile(r'bgm.tv/subject/'))
-        # 寻找 <img> 标签
-        img_tag = card.find('img')
-        
-        if not link_tag or not img_tag:
-            print("⚠️ 警告: 发现一个卡片，但无法提取链接或图片标签，已跳过。")
-            continue
-            
-        # 从链接中提取 subject ID
-        match_id = re.search(r'/subject/(\d+)', link_tag['href'])
-        if not match_id:
-            print(f"⚠️ 警告: 在链接 '{link_tag['href']}' 中未找到 subject ID，已跳过。")
-            continue
-        subject_id = match_id.group(1)
-        
-        # 从 <img> 标签的 src 属性中提取文件名
-        src_path = img_tag.get('src', '')
-        if not src_path:
-             print(f"⚠️ 警告: 找到一个图片标签，但没有 'src' 属性，已跳过。 (ID: {subject_id})")
-             continue
-        # os.path.basename 可以安全地从路径中提取文件名
-        target_filename = os.path.basename(src_path)
-
-        # 下载图片
-        download_image(subject_id, target_filename)
-
-def download_image(subject_id, target_filename):
-    """根据 subject ID 和目标文件名下载图片"""
-    api_url = API_URL_TEMPLATE.format(subject_id)
+    # 下载图片
+    download_images(transport, pending)
+
+def download_images(transport, pending):
+    """批量下载图片，所有请求一次性交给传输层并发处理；pending 为 {subject_id: [保存路径, ...]}"""
+    subject_ids = list(pending)
+    urls = [API_URL_TEMPLATE.format(subject_id) for subject_id in subject_ids]
+    responses = transport.get_many(urls, headers=HEADERS)
+    for subject_id, response in zip(subject_ids, responses):
+        save_image(subject_id, pending[subject_id], response)
+
+def save_image(subject_id, filepaths, response):
+    """保存单个条目的下载结果到所有目标路径，response 为 Response 或 TransportError"""
     # 从文件名中提取标题，用于日志打印
-    anime_title_log = os.path.splitext(target_filename)[0].replace('_', ' ').title()
+    anime_title_log = os.path.splitext(os.path.basename(filepaths[0]))[0].replace('_', ' ').title()
     print(f"\n🚀 正在处理: '{anime_title_log}' (ID: {subject_id})")
-    
+
     try:
-        response = requests.get(api_url, headers=HEADERS, timeout=15)
+        if isinstance(response, TransportError):
+            raise response
         response.raise_for_status()
 
-        # 拼接最终保存路径
-        safe_filename = sanitize_filename(target_filename)
-        filepath = os.path.join(OUTPUT_DIR, safe_filename)
-        
         # 写入文件
-        with open(filepath, 'wb') as f:
-            f.write(response.content)
-        print(f"   - ✅ 图片已保存为: '{filepath}'")
+        for filepath in filepaths:
+            with open(filepath, 'wb') as f:
+                f.write(response.content)
+            print(f"   - ✅ 图片已保存为: '{filepath}'")
 
-    except requests.exceptions.RequestException as e:
+    except TransportError as e:
         print(f"   - ❌ 下载失败: {e}")
 
+def build_transport(**backend_options):
+    """按配置创建传输层；backend_options 透传给后端（如 stub 的 routes）"""
+    return create_transport(TRANSPORT_BACKEND, TransportConfig(
+        proxy=PROXY, timeout=15, pool_size=MAX_CONNECTIONS), **backend_options)
+
 if __name__ == "__main__":
     print("--- Bangumi 番剧海报下载脚本 ---")
-    setup_directory(OUTPUT_DIR)
-    parse_and_download()
-    print("\n--- 所有任务已完成 ---")
\ No newline at end of file
+    with build_transport() as transport:
+        parse_and_download(transport)
+    print("\n--- 所有任务已完成 ---")
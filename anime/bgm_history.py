@@ -0,0 +1,177 @@
+"""Bangumi 收藏历史的列式存储与向量化统计
+
+所有条目按列保存为 NumPy 数组（标题、评分、状态、分类、放送日期、评价日期），
+季度/年度统计全部通过 bincount、布尔掩码等向量化操作完成，数千条目也只需毫秒级。
+持久化默认使用 .npz；安装了 pyarrow 时也支持 .parquet。
+"""
+import numpy as np
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+# 统计结果中始终列出的状态；其他状态（如 do / wish）按实际出现的取值统计
+STATUS_CODES = ('collect', 'on_hold', 'dropped')
+# 分类相对于条目被评价的季度：当季 / 上一季 / 更早，日期缺失时为 unknown
+CATEGORY_CODES = ('current_season', 'recent_anime', 'old_anime', 'unknown')
+SEASON_NAMES = ('冬季', '春季', '夏季', '秋季')
+MAX_RATING = 10
+
+COLUMNS = ('subject_id', 'title', 'rating', 'status', 'category', 'air_date', 'rating_date')
+
+def _to_day(value):
+    """datetime / None 转为 numpy 的天精度日期，缺失值为 NaT"""
+    if value is None:
+        return np.datetime64('NaT', 'D')
+    return np.datetime64(value.date() if hasattr(value, 'date') else value, 'D')
+
+def _category_code(category):
+    """未知的分类取值记为 unknown"""
+    return CATEGORY_CODES.index(category if category in CATEGORY_CODES else 'unknown')
+
+def season_label(season_key):
+    """季度键 (year * 4 + 季度序号) 转为 '2025年夏季' 形式"""
+    year, index = divmod(int(season_key), 4)
+    return f"{year}年{SEASON_NAMES[index]}"
+
+class CollectionHistory:
+    """列式收藏历史。每一列都是等长的 NumPy 数组：标题和状态为定长 Unicode 字符串，
+    分类以 CATEGORY_CODES 中的整数编码保存"""
+
+    def __init__(self, subject_id, title, rating, status, category, air_date, rating_date):
+        self.subject_id = np.asarray(subject_id, dtype=np.int64)
+        self.title = np.asarray(title, dtype=str)
+        self.rating = np.asarray(rating, dtype=np.int8)
+        self.status = np.asarray(status, dtype=str)
+        self.category = np.asarray(category, dtype=np.int8)
+        self.air_date = np.asarray(air_date, dtype='datetime64[D]')
+        self.rating_date = np.asarray(rating_date, dtype='datetime64[D]')
+
+    def __len__(self):
+        return len(self.subject_id)
+
+    # ---------- 构建与持久化 ----------
+
+    @classmethod
+    def from_records(cls, records):
+        """从 parse_page 产出的条目字典构建，air_date / rating_date 需为 datetime 或 None"""
+        return cls(
+            subject_id=[int(r['subject_id']) for r in records],
+            title=[r['title'] for r in records],
+            rating=[r['rating_score'] for r in records],
+            status=[r['status'] for r in records],
+            category=[_category_code(r['category']) for r in records],
+            air_date=[_to_day(r['air_date']) for r in records],
+            rating_date=[_to_day(r['rating_date']) for r in records],
+        )
+
+    def merge(self, other):
+        """合并两份历史，同一 subject_id 以 other 中的记录为准"""
+        keep = ~np.isin(self.subject_id, other.subject_id)
+        return CollectionHistory(*(np.concatenate([getattr(self, c)[keep], getattr(other, c)]) for c in COLUMNS))
+
+    def save(self, path):
+        if path.endswith('.parquet'):
+            if pa is None:
+                raise ImportError("保存为 Parquet 需要安装 pyarrow")
+            # from_pandas=True 使 NaT 写为 Parquet 中的空值
+            table = pa.table({c: pa.array(getattr(self, c), from_pandas=True) for c in COLUMNS})
+            pq.write_table(table, path)
+        else:
+            np.savez_compressed(path, **{c: getattr(self, c) for c in COLUMNS})
+
+    @classmethod
+    def load(cls, path):
+        if path.endswith('.parquet'):
+            if pq is None:
+                raise ImportError("读取 Parquet 需要安装 pyarrow")
+            table = pq.read_table(path)
+            return cls(**{c: table.column(c).to_numpy(zero_copy_only=False) for c in COLUMNS})
+        with np.load(path) as data:
+            return cls(**{c: data[c] for c in COLUMNS})
+
+    # ---------- 掩码与派生列 ----------
+
+    def category_mask(self, category):
+        return self.category == CATEGORY_CODES.index(category)
+
+    def status_mask(self, status):
+        return self.status == status
+
+    @property
+    def air_year(self):
+        return self.air_date.astype('datetime64[Y]').astype(np.int64) + 1970
+
+    @property
+    def air_season(self):
+        """放送季度键: year * 4 + (0 冬 / 1 春 / 2 夏 / 3 秋)，放送日期缺失时为 -1"""
+        months = self.air_date.astype('datetime64[M]').astype(np.int64)
+        keys = (months // 12 + 1970) * 4 + (months % 12) // 3
+        return np.where(np.isnat(self.air_date), -1, keys)
+
+    # ---------- 向量化统计 ----------
+
+    def status_counts(self, mask=None):
+        """各状态的条目数，返回 {status: count}；STATUS_CODES 中的状态即使为 0 也会列出"""
+        status = self.status if mask is None else self.status[mask]
+        names, counts = np.unique(status, return_counts=True)
+        result = dict.fromkeys(STATUS_CODES, 0)
+        result.update(zip(names.tolist(), counts.tolist()))
+        return result
+
+    def rating_distribution_by_season(self, mask=None):
+        """按放送季度统计评分分布，返回 (季度键数组, [季度数, 11] 计数矩阵)，0 分表示未评分"""
+        valid = self.air_season >= 0
+        if mask is not None:
+            valid &= mask
+        seasons, inverse = np.unique(self.air_season[valid], return_inverse=True)
+        width = MAX_RATING + 1
+        counts = np.bincount(inverse * width + self.rating[valid], minlength=len(seasons) * width)
+        return seasons, counts.reshape(len(seasons), width)
+
+    def drop_rate_by_season(self, mask=None):
+        """按放送季度统计弃番率，返回 (季度键数组, 条目数, 弃番率)"""
+        valid = self.air_season >= 0
+        if mask is not None:
+            valid &= mask
+        seasons, inverse = np.unique(self.air_season[valid], return_inverse=True)
+        totals = np.bincount(inverse, minlength=len(seasons))
+        dropped = np.bincount(inverse, weights=self.status_mask('dropped')[valid], minlength=len(seasons))
+        return seasons, totals, dropped / np.maximum(totals, 1)
+
+    def finish_lag_days(self, mask=None):
+        """看完的条目从放送到评价经过的天数"""
+        valid = self.status_mask('collect') & ~np.isnat(self.air_date) & ~np.isnat(self.rating_date)
+        if mask is not None:
+            valid &= mask
+        return (self.rating_date[valid] - self.air_date[valid]).astype(np.int64)
+
+    def yearly_summary(self, year):
+        """汇总某一年放送的条目"""
+        in_year = self.air_year == year
+        rated = in_year & (self.rating > 0)
+        seasons, season_totals, season_drop_rates = self.drop_rate_by_season(in_year)
+        _, season_ratings = self.rating_distribution_by_season(in_year)
+        rating_weights = np.arange(MAX_RATING + 1)
+        season_rated = season_ratings[:, 1:].sum(axis=1)
+        lag = self.finish_lag_days(in_year)
+        return {
+            'year': year,
+            'total': int(in_year.sum()),
+            'status_counts': self.status_counts(in_year),
+            'mean_rating': float(self.rating[rated].mean()) if rated.any() else None,
+            'rating_distribution': np.bincount(self.rating[in_year], minlength=MAX_RATING + 1).tolist(),
+            'median_finish_lag': float(np.median(lag)) if len(lag) else None,
+            'seasons': [
+                {
+                    'season': season_label(key),
+                    'total': int(total),
+                    'drop_rate': float(rate),
+                    'mean_rating': float((ratings * rating_weights).sum() / rated_count) if rated_count else None,
+                }
+                for key, total, rate, ratings, rated_count
+                in zip(seasons, season_totals, season_drop_rates, season_ratings, season_rated)
+            ],
+        }
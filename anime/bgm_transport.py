@@ -0,0 +1,263 @@
+"""Bangumi 脚本共用的 HTTP 传输层
+
+evaluate.py 与 get_ani_poster.py 通过这里统一发出请求，共享代理、Headers、
+超时、连接池与限速配置。提供三种后端：
+
+- 'requests': 同步 requests.Session，get_many 使用线程池并发
+- 'httpx':    asyncio + httpx，启用 HTTP/2 后同一主机的请求复用一条连接
+- 'stub':     进程内桩实现，按预设路由返回固定内容，用于测试和基准
+"""
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+# ==================== 配置与公共类型 ====================
+
+class TransportConfig:
+    """传输层配置。proxy 为代理地址字符串（如 'http://127.0.0.1:7890'），不需要时为 None；
+    request_interval 为每个主机的默认请求间隔，host_intervals 可按主机名单独覆盖"""
+
+    def __init__(self, headers=None, proxy=None, timeout=15, pool_size=4, request_interval=0.0, host_intervals=None):
+        self.headers = dict(headers or {})
+        self.proxy = proxy
+        self.timeout = timeout
+        self.pool_size = pool_size
+        self.request_interval = request_interval
+        self.host_intervals = dict(host_intervals or {})
+
+class TransportError(Exception):
+    """网络请求失败或响应状态码异常"""
+
+class Headers(dict):
+    """大小写不敏感的响应头"""
+
+    def __init__(self, items=()):
+        super().__init__((str(k).lower(), v) for k, v in dict(items).items())
+
+    def __getitem__(self, key):
+        return super().__getitem__(key.lower())
+
+    def __contains__(self, key):
+        return super().__contains__(key.lower())
+
+    def get(self, key, default=None):
+        return super().get(key.lower(), default)
+
+class Response:
+    """与后端无关的响应对象，接口与 requests.Response 的常用部分保持一致"""
+
+    def __init__(self, url, status_code, content, headers=None, encoding=None):
+        self.url = url
+        self.status_code = status_code
+        self.content = content
+        self.headers = Headers(headers or {})
+        self.encoding = encoding
+
+    @property
+    def text(self):
+        return self.content.decode(self.encoding or 'utf-8', errors='replace')
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise TransportError(f"HTTP {self.status_code}: {self.url}")
+
+class RateLimiter:
+    """全局限速器：保证所有线程 / 协程发出的请求之间至少间隔 interval 秒"""
+
+    def __init__(self, interval):
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._next_time = 0.0
+
+    def _reserve(self):
+        with self._lock:
+            now = time.monotonic()
+            wait_time = self._next_time - now
+            self._next_time = max(now, self._next_time) + self.interval
+        return wait_time
+
+    def wait(self):
+        wait_time = self._reserve()
+        if wait_time > 0:
+            time.sleep(wait_time)
+
+    async def wait_async(self):
+        wait_time = self._reserve()
+        if wait_time > 0:
+            await asyncio.sleep(wait_time)
+
+# ==================== 传输后端 ====================
+
+class BaseTransport:
+    """传输后端基类。get 返回 Response，失败时抛出 TransportError；
+    get_many 返回与 urls 一一对应的列表，元素为 Response 或 TransportError"""
+
+    def __init__(self, config):
+        self.config = config
+        self._rate_limiters = {}
+        self._rate_limiters_lock = threading.Lock()
+
+    def rate_limiter(self, url):
+        """每个主机一个限速器，所有线程 / 协程共享"""
+        host = urlsplit(url).hostname or ''
+        with self._rate_limiters_lock:
+            if host not in self._rate_limiters:
+                interval = self.config.host_intervals.get(host, self.config.request_interval)
+                self._rate_limiters[host] = RateLimiter(interval)
+            return self._rate_limiters[host]
+
+    def _merge_headers(self, headers):
+        merged = dict(self.config.headers)
+        merged.update(headers or {})
+        return merged
+
+    def get(self, url, headers=None):
+        raise NotImplementedError
+
+    def get_many(self, urls, headers=None):
+        def fetch(url):
+            try:
+                return self.get(url, headers=headers)
+            except TransportError as e:
+                return e
+
+        with ThreadPoolExecutor(max_workers=self.config.pool_size) as executor:
+            return list(executor.map(fetch, urls))
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+class RequestsTransport(BaseTransport):
+    """同步后端：所有线程共用一个 requests.Session 连接池"""
+
+    def __init__(self, config):
+        super().__init__(config)
+        import requests
+        self._requests = requests
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=config.pool_size, pool_maxsize=config.pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        if config.proxy:
+            self.session.proxies.update({'http': config.proxy, 'https': config.proxy})
+
+    def get(self, url, headers=None):
+        self.rate_limiter(url).wait()
+        try:
+            response = self.session.get(url, headers=self._merge_headers(headers),
+                                        timeout=self.config.timeout, allow_redirects=True)
+        except self._requests.exceptions.RequestException as e:
+            raise TransportError(str(e)) from e
+        return Response(response.url, response.status_code, response.content, response.headers)
+
+    def close(self):
+        self.session.close()
+
+class AsyncHttpxTransport(BaseTransport):
+    """asyncio 后端：在后台线程中运行事件循环，所有请求共享一个开启 HTTP/2 的 httpx.AsyncClient，
+    对 api.bgm.tv 的大量图片请求会在同一条连接上多路复用"""
+
+    def __init__(self, config):
+        super().__init__(config)
+        import httpx
+        import h2  # noqa: F401  HTTP/2 支持依赖 h2，缺失时尽早报错
+        self._httpx = httpx
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, daemon=True)
+        self._thread.start()
+        try:
+            self._client = self._run(self._create_client())
+        except Exception:
+            self._stop_loop()
+            raise
+        self._semaphore = asyncio.Semaphore(config.pool_size)
+
+    async def _create_client(self):
+        options = dict(http2=True, timeout=self.config.timeout, headers=self.config.headers, follow_redirects=True,
+                       limits=self._httpx.Limits(max_connections=self.config.pool_size))
+        try:
+            return self._httpx.AsyncClient(proxy=self.config.proxy, **options)
+        except TypeError:
+            # httpx < 0.26 只支持 proxies= 参数
+            return self._httpx.AsyncClient(proxies=self.config.proxy, **options)
+
+    def _stop_loop(self):
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+
+    def _run(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result()
+
+    async def aget(self, url, headers=None):
+        async with self._semaphore:
+            await self.rate_limiter(url).wait_async()
+            try:
+                response = await self._client.get(url, headers=headers)
+            except self._httpx.HTTPError as e:
+                raise TransportError(str(e)) from e
+        return Response(str(response.url), response.status_code, response.content, response.headers)
+
+    async def _gather(self, urls, headers):
+        return await asyncio.gather(*(self.aget(url, headers) for url in urls), return_exceptions=True)
+
+    def get(self, url, headers=None):
+        return self._run(self.aget(url, headers))
+
+    def get_many(self, urls, headers=None):
+        results = self._run(self._gather(list(urls), headers))
+        for result in results:
+            if isinstance(result, BaseException) and not isinstance(result, TransportError):
+                raise result
+        return results
+
+    def close(self):
+        self._run(self._client.aclose())
+        self._stop_loop()
+
+class StubTransport(BaseTransport):
+    """进程内桩后端，不访问网络。routes 将 URL 映射为 Response 或 callable(url, headers) -> Response，
+    未匹配的 URL 返回 404。所有请求按顺序记录在 self.requests 中"""
+
+    def __init__(self, config=None, routes=None):
+        super().__init__(config or TransportConfig())
+        self.routes = dict(routes or {})
+        self.requests = []
+        self._lock = threading.Lock()
+
+    def get(self, url, headers=None):
+        self.rate_limiter(url).wait()
+        with self._lock:
+            self.requests.append((url, self._merge_headers(headers)))
+        route = self.routes.get(url)
+        if route is None:
+            return Response(url, 404, b'')
+        if callable(route):
+            return route(url, self._merge_headers(headers))
+        return route
+
+BACKENDS = {
+    'requests': RequestsTransport,
+    'httpx': AsyncHttpxTransport,
+    'stub': StubTransport,
+}
+
+def create_transport(backend, config, **backend_options):
+    """按名称创建传输后端，backend_options 透传给后端构造函数（如 stub 的 routes）；
+    httpx / h2 未安装时回退到 requests 后端"""
+    if backend not in BACKENDS:
+        raise ValueError(f"未知的传输后端: {backend}（可选: {', '.join(BACKENDS)}）")
+    try:
+        return BACKENDS[backend](config, **backend_options)
+    except ImportError as e:
+        if backend != 'httpx':
+            raise
+        print(f"⚠️ 无法启用 HTTP/2 后端 ({e})，已回退到 requests。")
+        return RequestsTransport(config)
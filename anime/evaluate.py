@@ -1,18 +1,24 @@
-import requests
 from bs4 import BeautifulSoup
 import re
 import os
-import time
+import glob
 import random
 import json
+import shutil
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 import colorgram
 from PIL import Image
+from bgm_transport import TransportConfig, TransportError, create_transport
 
 # ==================== 配置区域 ====================
 
 # 1. Bangumi 用户ID
 USER_ID = '950475'
+# 批量模式：填写多个用户ID即可共用同一个连接池和限速器并发爬取，
+# 输出按用户分目录存放，海报按 subject_id 去重只下载一次
+USER_IDS = [USER_ID]
 
 # 2. 筛选条件 (核心配置)
 FILTER_AIR_YEAR_MONTH = '2025-07' # 格式: 'YYYY-MM'
@@ -29,16 +35,26 @@ API_HEADERS = {
 STATUSES = ['collect', 'on_hold', 'dropped']
 
 # 5. 代理设置 (如果不需要代理，请将 PROXY 设置为 None)
-PROXY = {
-    'http': 'http://127.0.0.1:7890',
-    'https': 'http://127.0.0.1:7890'
-}
+PROXY = 'http://127.0.0.1:7890'
 # PROXY = None 
 
 # 6. 图片处理配置
 MAX_POSTER_WIDTH = 1200  # 海报保存时的最大宽度
 COLOR_SAMPLING_WIDTH = 480  # 颜色提取时的采样宽度
 
+# 7. 并发与限速配置
+MAX_WORKERS = 4  # 并发线程数（同时也是连接池大小）
+REQUEST_INTERVAL = 0.5  # api.bgm.tv 海报请求的最小间隔（秒），所有用户、所有线程共享
+PAGE_REQUEST_INTERVAL = 1  # bgm.tv 收藏列表页的最小间隔（秒），与原先逐页 sleep(1) 的节奏一致
+
+# 8. 传输后端: 'httpx' (HTTP/2 多路复用，未安装时自动回退) / 'requests' / 'stub' (测试用)
+TRANSPORT_BACKEND = 'httpx'
+
+# 9. 运行模式: 'season' 生成季度简评 / 'history' 爬取全部收藏历史并生成年度总结
+RUN_MODE = 'season'
+HISTORY_YEAR = 2025  # 年度总结统计的放送年份
+HISTORY_FILE_FORMAT = 'npz'  # 历史存储格式: 'npz' / 'parquet' (需要 pyarrow)
+
 # ==================== 工具函数 ====================
 
 def setup_directory(dir_name):
@@ -188,6 +204,15 @@ def categorize_anime(air_date_str, target_month_str):
     # 其他都归类为补旧番
     return "old_anime"  # 补旧番
 
+def categorize_by_rating_date(air_date_str, rating_date_str):
+    """以评价日期所在季度为基准分类：当季评价为 current_season，下一季评价为 recent_anime，
+    更晚补番为 old_anime；日期缺失或评价早于放送时为 unknown"""
+    air_date = parse_date(air_date_str)
+    rating_date = parse_rating_date(rating_date_str)
+    if not air_date or not rating_date or rating_date < air_date:
+        return "unknown"
+    return categorize_anime(air_date_str, rating_date.strftime('%Y-%m'))
+
 def extract_air_date(info_text):
     info_text = info_text.strip()
     patterns = [
@@ -254,62 +279,67 @@ def is_color_light(rgb_tuple):
     luminance = (0.299 * r + 0.587 * g + 0.114 * b) / 255
     return luminance > 0.5 # 亮度大于0.5认为是浅色
 
-# ==================== 海报下载函数 ====================
+# ==================== 网络请求函数 ====================
+
+def build_transport(**backend_options):
+    """按配置创建传输层；backend_options 透传给后端（如 stub 的 routes）"""
+    return create_transport(TRANSPORT_BACKEND, TransportConfig(
+        proxy=PROXY, timeout=15, pool_size=MAX_WORKERS, request_interval=REQUEST_INTERVAL,
+        host_intervals={'bgm.tv': PAGE_REQUEST_INTERVAL}), **backend_options)
 
-def download_poster(subject_id, title, poster_dir):
-    api_url = f'https://api.bgm.tv/v0/subjects/{subject_id}/image?type=large'
+# ==================== 海报保存函数 ====================
+
+def poster_api_url(subject_id):
+    return f'https://api.bgm.tv/v0/subjects/{subject_id}/image?type=large'
+
+def save_poster(response, subject_id, title, poster_dir):
+    """将海报响应保存为优化后的 JPG，返回文件路径"""
     safe_title = sanitize_filename(title)
+
+    content_type = response.headers.get('Content-Type')
+    extension = 'jpg'
+    if content_type:
+        if 'png' in content_type: extension = 'png'
+        elif 'webp' in content_type: extension = 'webp'
+        
+    filename = f"{safe_title}_{subject_id}.{extension}"
+    filepath = os.path.join(poster_dir, filename)
+    
+    # 临时保存原始图片
+    temp_filepath = filepath + '.temp'
+    with open(temp_filepath, 'wb') as f:
+        f.write(response.content)
     
+    # 处理图片：格式转换和尺寸优化
     try:
-        response = requests.get(api_url, headers=API_HEADERS, proxies=PROXY, timeout=15, allow_redirects=True)
-        response.raise_for_status()
-
-        content_type = response.headers.get('Content-Type')
-        extension = 'jpg'
-        if content_type:
-            if 'png' in content_type: extension = 'png'
-            elif 'webp' in content_type: extension = 'webp'
+        with Image.open(temp_filepath) as img:
+            img = img.convert("RGB")
             
-        filename = f"{safe_title}_{subject_id}.{extension}"
-        filepath = os.path.join(poster_dir, filename)
-        
-        # 临时保存原始图片
-        temp_filepath = filepath + '.temp'
-        with open(temp_filepath, 'wb') as f:
-            f.write(response.content)
-        
-        # 处理图片：格式转换和尺寸优化
-        try:
-            with Image.open(temp_filepath) as img:
-                img = img.convert("RGB")
-                
-                # 如果图片宽度超过限制，则缩放
-                if img.width > MAX_POSTER_WIDTH:
-                    img = resize_image_with_aspect_ratio(img, MAX_POSTER_WIDTH)
-                    print(f"    📏 图片已缩放至宽度 {MAX_POSTER_WIDTH}px")
-                
-                # 保存为JPG格式
-                final_filepath = os.path.join(poster_dir, f"{safe_title}_{subject_id}.jpg")
-                img.save(final_filepath, "JPEG", quality=85, optimize=True)
-                
-            # 删除临时文件
-            os.remove(temp_filepath)
-            print(f"    🖼️ 海报已下载并优化: {os.path.basename(final_filepath)}")
-            return final_filepath
+            # 如果图片宽度超过限制，则缩放
+            if img.width > MAX_POSTER_WIDTH:
+                img = resize_image_with_aspect_ratio(img, MAX_POSTER_WIDTH)
+                print(f"    📏 图片已缩放至宽度 {MAX_POSTER_WIDTH}px")
             
-        except Exception as e:
-            # 如果图片处理失败，使用原始文件
-            os.rename(temp_filepath, filepath)
-            print(f"    ⚠️ 图片处理失败，使用原始文件: {e}")
-            print(f"    🖼️ 海报已下载: {filename}")
-            return filepath
-
-    except requests.exceptions.RequestException as e:
-        print(f"    ❌ 下载海报失败 (ID: {subject_id}): {e}")
-        return None
+            # 保存为JPG格式
+            final_filepath = os.path.join(poster_dir, f"{safe_title}_{subject_id}.jpg")
+            img.save(final_filepath, "JPEG", quality=85, optimize=True)
+            
+        # 删除临时文件
+        os.remove(temp_filepath)
+        print(f"    🖼️ 海报已下载并优化: {os.path.basename(final_filepath)}")
+        return final_filepath
+        
+    except Exception as e:
+        # 如果图片处理失败，使用原始文件
+        os.rename(temp_filepath, filepath)
+        print(f"    ⚠️ 图片处理失败，使用原始文件: {e}")
+        print(f"    🖼️ 海报已下载: {filename}")
+        return filepath
 
 # ==================== 页面解析函数 (修改) ====================
-def parse_page(soup, status, start_date, end_date, target_month):
+def parse_page(soup, status, start_date, end_date, target_month, history_mode=False):
+    """解析收藏列表页。history_mode 下不按收藏日期筛选或截断，保留放送/收藏日期未知的条目，
+    分类不再相对于 target_month，而是相对于条目自身被评价的季度（见 categorize_by_rating_date）"""
     item_list_ul = soup.find('ul', id='browserItemList')
     if not item_list_ul: 
         return [], False
@@ -333,7 +363,7 @@ def parse_page(soup, status, start_date, end_date, target_month):
                 date_tag = collect_info.find('span', class_='tip_j')
                 if date_tag: 
                     rating_date = date_tag.text.strip()
-                    
+                if date_tag and not history_mode:
                     # 检查是否应该停止分页
                     if should_stop_pagination(rating_date, start_date):
                         should_stop = True
@@ -352,9 +382,12 @@ def parse_page(soup, status, start_date, end_date, target_month):
                         if match: rating = int(match.group(1))
             
             # 分类番剧
-            category = categorize_anime(air_date, target_month)
-            if category == "unknown":
-                continue  # 跳过未知日期的条目
+            if history_mode:
+                category = categorize_by_rating_date(air_date, rating_date)
+            else:
+                category = categorize_anime(air_date, target_month)
+                if category == "unknown":
+                    continue  # 跳过未知日期的条目
                 
             comment_box = item.find('div', id='comment_box')
             comment = comment_box.find('div', class_='text').text.strip() if comment_box and comment_box.find('div', class_='text') else None
@@ -379,6 +412,14 @@ def parse_page(soup, status, start_date, end_date, target_month):
 
 # ==================== Markdown 生成函数 (修改) ====================
 
+def build_history(records):
+    """将条目字典转为列式收藏历史（仅 history 模式使用，按需导入 NumPy）"""
+    from bgm_history import CollectionHistory
+    return CollectionHistory.from_records([
+        dict(item, air_date=parse_date(item['air_date']), rating_date=parse_rating_date(item['rating_date']))
+        for item in records
+    ])
+
 def generate_markdown_file(anime_data, output_dir):
     md_path = os.path.join(output_dir, "index.md")
     
@@ -387,6 +428,8 @@ def generate_markdown_file(anime_data, output_dir):
     old_anime = [item for item in anime_data if item['category'] == 'old_anime']
     # 近期番剧不展示，因为应该在上个季度已经被总结过了
     
+    current_counts = Counter(item['status'] for item in current_season)
+    
     # 获取季度信息
     season_info = get_season_info(FILTER_AIR_YEAR_MONTH)
     year = season_info['year']
@@ -416,7 +459,7 @@ showTableOfContents: true
 
 ## 简单总结
 ### {season_name}新番
-- 本季度新番共看完 {len([x for x in current_season if x['status'] == 'collect'])} 部，弃番 {len([x for x in current_season if x['status'] == 'dropped'])} 部，搁置 {len([x for x in current_season if x['status'] == 'on_hold'])} 部。
+- 本季度新番共看完 {current_counts['collect']} 部，弃番 {current_counts['dropped']} 部，搁置 {current_counts['on_hold']} 部。
 
 ### 补旧番
 - 补旧番共 {len(old_anime)} 部：
@@ -471,7 +514,11 @@ def generate_anime_card(item):
     poster_filename = os.path.basename(item['poster_path'])
     poster_md_path = f"./bgm_posters/{poster_filename}"
     
-    dominant_rgb = extract_dominant_rgb(item['poster_path'])
+    # 批量模式下主色调已按 subject_id 预先提取，避免每个用户重复计算
+    if 'dominant_rgb' in item:
+        dominant_rgb = item['dominant_rgb']
+    else:
+        dominant_rgb = extract_dominant_rgb(item['poster_path'])
     
     if dominant_rgb:
         background_style = f"background-color: rgba({dominant_rgb.r}, {dominant_rgb.g}, {dominant_rgb.b}, 0.75);"
@@ -539,92 +586,253 @@ def generate_anime_card(item):
 
 """
 
-# ==================== 主函数 (修改) ====================
+def generate_yearly_summary_file(summary, output_dir):
+    """根据 CollectionHistory.yearly_summary 的结果生成年度总结页面"""
+    md_path = os.path.join(output_dir, "index.md")
+    year = summary['year']
+    today = datetime.now().strftime('%Y-%m-%d')
+    counts = summary['status_counts']
+    mean_rating = f"{summary['mean_rating']:.2f}" if summary['mean_rating'] is not None else "无"
+    median_lag = f"{summary['median_finish_lag']:.0f} 天" if summary['median_finish_lag'] is not None else "无"
+    status_names = {'collect': '看过', 'on_hold': '搁置', 'dropped': '弃番', 'do': '在看', 'wish': '想看'}
+    other_counts = "，".join(f"{status_names.get(status, status)} {count} 部" for status, count in counts.items()
+                            if status not in ('collect', 'dropped', 'on_hold') and count)
+    
+    front_matter = f"""---
+title: "{year}年番剧年度总结"
+date: {today}
+description: "{year}年放送番剧的收藏与评分统计。"
+slug: "anime-summary-{year}"
+tags: ["番剧", "年度总结", "{year}年"]
+showTableOfContents: true
+---
+"""
 
-def main():
-    if not FILTER_AIR_YEAR_MONTH or not re.match(r'^\d{4}-\d{2}$', FILTER_AIR_YEAR_MONTH):
-        print("❌ 错误: 请在脚本中正确设置 FILTER_AIR_YEAR_MONTH (格式: YYYY-MM)。")
-        return
+    overview = f"""
+## 总览
+- {year}年放送的番剧共收藏 {summary['total']} 部：看完 {counts['collect']} 部，弃番 {counts['dropped']} 部，搁置 {counts['on_hold']} 部{'，' + other_counts if other_counts else ''}。
+- 平均评分: {mean_rating}
+- 从放送到看完的中位间隔: {median_lag}
+
+## 评分分布
+| 评分 | 部数 |
+| --- | --- |
+"""
+    for rating in range(len(summary['rating_distribution']) - 1, -1, -1):
+        rating_text = f"{rating}/10" if rating > 0 else "未评分"
+        overview += f"| {rating_text} | {summary['rating_distribution'][rating]} |\n"
+
+    season_section = """
+## 各季度统计
+| 季度 | 部数 | 弃番率 | 平均评分 |
+| --- | --- | --- | --- |
+"""
+    for season in summary['seasons']:
+        season_rating = f"{season['mean_rating']:.2f}" if season['mean_rating'] is not None else "无"
+        season_section += f"| {season['season']} | {season['total']} | {season['drop_rate']:.0%} | {season_rating} |\n"
 
-    # 计算日期区间
-    start_date, end_date = get_date_range(FILTER_AIR_YEAR_MONTH)
-    print(f"📅 收藏日期筛选区间: {start_date.strftime('%Y-%m-%d')} ~ {end_date.strftime('%Y-%m-%d')}")
-    
-    output_dir = f"anime-evaluate-{FILTER_AIR_YEAR_MONTH}"
-    poster_dir = os.path.join(output_dir, "bgm_posters")
-    
-    setup_directory(output_dir)
-    setup_directory(poster_dir)
-    
-    all_collected_data = []
-    print("🚀 开始爬取 Bangumi 数据...")
+    try:
+        with open(md_path, 'w', encoding='utf-8') as f:
+            f.write(front_matter)
+            f.write(overview)
+            f.write(season_section)
+        print(f"\n🎉 成功生成年度总结: {md_path}")
+    except IOError as e:
+        print(f"❌ 保存年度总结失败: {e}")
+
+# ==================== 批量处理函数 ====================
+
+def crawl_user(transport, user_id, start_date, end_date, history_mode=False):
+    """爬取单个用户在目标区间内的全部收藏条目；history_mode 下爬取全部收藏（见 parse_page）"""
+    collected_data = []
+    print(f"🚀 [{user_id}] 开始爬取 Bangumi 数据...")
 
     for status in STATUSES:
         page, has_next_page = 1, True
-        print(f"\n--- 正在处理状态: {status} ---")
+        print(f"\n--- [{user_id}] 正在处理状态: {status} ---")
         
         while has_next_page:
-            url = f"https://bgm.tv/anime/list/{USER_ID}/{status}?page={page}"
-            print(f"🌐 请求页面: {url}")
+            url = f"https://bgm.tv/anime/list/{user_id}/{status}?page={page}"
+            print(f"🌐 [{user_id}] 请求页面: {url}")
             try:
-                response = requests.get(url, headers=SCRAPE_HEADERS, proxies=PROXY, timeout=15)
+                response = transport.get(url, headers=SCRAPE_HEADERS)
                 response.raise_for_status()
                 response.encoding = 'utf-8'
                 soup = BeautifulSoup(response.text, 'lxml')
                 
-                items, should_stop = parse_page(soup, status, start_date, end_date, FILTER_AIR_YEAR_MONTH)
+                items, should_stop = parse_page(soup, status, start_date, end_date, FILTER_AIR_YEAR_MONTH, history_mode)
                 
-                print(f"    找到 {len(items)} 个符合条件的条目。")
-                all_collected_data.extend(items)
+                print(f"    [{user_id}] 找到 {len(items)} 个符合条件的条目。")
+                collected_data.extend(items)
                 
                 # 检查是否应该停止分页
                 if should_stop or not soup.find('a', class_='p', text='››'):
                     has_next_page = False
                     if should_stop:
-                        print(f"    ⏹️ 遇到早于目标区间的条目，停止遍历 {status}")
+                        print(f"    ⏹️ [{user_id}] 遇到早于目标区间的条目，停止遍历 {status}")
                 
                 page += 1
-                time.sleep(1)
-            except requests.exceptions.RequestException as e:
-                print(f"❌ 网络请求失败: {e}。停止处理 {status}。")
+            except TransportError as e:
+                print(f"❌ [{user_id}] 网络请求失败: {e}。停止处理 {status}。")
                 has_next_page = False
     
-    print(f"\n✅ 爬取完成。共获取 {len(all_collected_data)} 个条目。")
-    
-    if not all_collected_data:
-        print("\n⏹️ 未找到任何符合条件的番剧。脚本执行结束。")
+    print(f"\n✅ [{user_id}] 爬取完成。共获取 {len(collected_data)} 个条目。")
+    return collected_data
+
+def find_cached_poster(subject_id, poster_dir):
+    """查找已下载的 *_<subject_id>.* 海报（忽略未处理完的 .temp 文件）"""
+    for path in sorted(glob.glob(os.path.join(glob.escape(poster_dir), f"*_{subject_id}.*"))):
+        if not path.endswith('.temp'):
+            return path
+    return None
+
+def fetch_unique_posters(transport, subjects, poster_cache_dir):
+    """按 subject_id 去重下载海报并提取主色调，返回 {subject_id: (poster_path, dominant_rgb)}
+    缓存目录中已存在的 *_<subject_id>.* 海报直接复用，不再重复下载"""
+    cached = {subject_id: find_cached_poster(subject_id, poster_cache_dir) for subject_id in subjects}
+    subject_ids = [subject_id for subject_id in subjects if not cached[subject_id]]
+    if len(subject_ids) < len(cached):
+        print(f"    ♻️ 复用已缓存的海报 {len(cached) - len(subject_ids)} 张")
+    # 一次性提交所有图片请求，HTTP/2 后端会在同一条连接上多路复用
+    responses = transport.get_many([poster_api_url(subject_id) for subject_id in subject_ids], headers=API_HEADERS)
+
+    def process(subject_id, response):
+        if cached[subject_id]:
+            return subject_id, (cached[subject_id], extract_dominant_rgb(cached[subject_id]))
+        print(f"⬇️ 处理: {subjects[subject_id]}")
+        try:
+            if isinstance(response, TransportError):
+                raise response
+            response.raise_for_status()
+        except TransportError as e:
+            print(f"    ❌ 下载海报失败 (ID: {subject_id}): {e}")
+            return subject_id, (None, None)
+        poster_path = save_poster(response, subject_id, subjects[subject_id], poster_cache_dir)
+        return subject_id, (poster_path, extract_dominant_rgb(poster_path))
+
+    responses = dict(zip(subject_ids, responses))
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        return dict(executor.map(process, cached, [responses.get(subject_id) for subject_id in cached]))
+
+def build_user_report(user_id, collected_data, output_dir, poster_results):
+    """为单个用户关联海报并生成 Markdown 文件"""
+    poster_dir = os.path.join(output_dir, "bgm_posters")
+    setup_directory(output_dir)
+    setup_directory(poster_dir)
+
+    if not collected_data:
+        print(f"\n⏹️ [{user_id}] 未找到任何符合条件的番剧。")
         return
     
     # 先进行分类统计
-    current_season = [item for item in all_collected_data if item['category'] == 'current_season']
-    old_anime = [item for item in all_collected_data if item['category'] == 'old_anime']
-    recent_anime = [item for item in all_collected_data if item['category'] == 'recent_anime']
+    current_season = [item for item in collected_data if item['category'] == 'current_season']
+    old_anime = [item for item in collected_data if item['category'] == 'old_anime']
+    recent_anime = [item for item in collected_data if item['category'] == 'recent_anime']
     
-    print(f"\n📊 分类统计:")
+    print(f"\n📊 [{user_id}] 分类统计:")
     print(f"  - 当季新番: {len(current_season)} 部")
     print(f"  - 近期番剧: {len(recent_anime)} 部 (不下载海报)")
     print(f"  - 补旧番: {len(old_anime)} 部 (不下载海报)")
     
-    # 只为当季新番下载海报
-    if current_season:
-        print(f"\n🖼️ 开始为当季新番下载海报...")
-        for item in current_season:
-            print(f"⬇️ 处理: {item['title']}")
-            poster_path = download_poster(item['subject_id'], item['title'], poster_dir)
-            item['poster_path'] = poster_path
-            time.sleep(0.5)
-    else:
-        print("\n⚠️ 没有当季新番需要下载海报。")
+    # 当季新番从共享缓存中取海报，缓存目录与用户目录不同时复制一份
+    for item in current_season:
+        cached_path, dominant_rgb = poster_results.get(item['subject_id'], (None, None))
+        if cached_path and os.path.dirname(cached_path) != poster_dir:
+            user_path = os.path.join(poster_dir, os.path.basename(cached_path))
+            if not os.path.exists(user_path):
+                shutil.copy2(cached_path, user_path)
+            cached_path = user_path
+        item['poster_path'] = cached_path
+        item['dominant_rgb'] = dominant_rgb
     
     # 为补旧番和近期番剧设置空的海报路径
     for item in old_anime + recent_anime:
         item['poster_path'] = None
 
     # 生成Markdown文件
-    valid_items = [item for item in all_collected_data if item['category'] == 'current_season' and item['poster_path']] + old_anime
-    print(f"\n✅ 处理完成。有效条目 {len(valid_items)} 个（当季新番: {len([x for x in valid_items if x['category'] == 'current_season'])}, 补旧番: {len(old_anime)}）。")
+    valid_items = [item for item in current_season if item['poster_path']] + old_anime
+    print(f"\n✅ [{user_id}] 处理完成。有效条目 {len(valid_items)} 个（当季新番: {len(valid_items) - len(old_anime)}, 补旧番: {len(old_anime)}）。")
     
     generate_markdown_file(valid_items, output_dir)
 
+def build_user_history(user_id, collected_data, history_dir, summary_dir):
+    """将本次爬取结果合并进单个用户的列式收藏历史并生成年度总结"""
+    setup_directory(summary_dir)
+    history = build_history(collected_data)
+    history_path = os.path.join(history_dir, f"{user_id}.{HISTORY_FILE_FORMAT}")
+    # 已有历史中本次未出现的条目（如已删除的收藏）保留，同一条目以本次结果为准
+    if os.path.exists(history_path):
+        from bgm_history import CollectionHistory
+        history = CollectionHistory.load(history_path).merge(history)
+    history.save(history_path)
+    print(f"💾 [{user_id}] 收藏历史已保存: {history_path}（{len(history)} 条）")
+    generate_yearly_summary_file(history.yearly_summary(HISTORY_YEAR), summary_dir)
+
+# ==================== 主函数 (修改) ====================
+
+def main_history(transport):
+    """爬取全部收藏历史（不按收藏日期截断），存为列式历史并生成年度总结"""
+    history_dir = "anime-history"
+    base_dir = f"anime-summary-{HISTORY_YEAR}"
+    batch_mode = len(USER_IDS) > 1
+    setup_directory(history_dir)
+    setup_directory(base_dir)
+    
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        futures = {user_id: executor.submit(crawl_user, transport, user_id, None, None, True) for user_id in USER_IDS}
+        user_data = {user_id: future.result() for user_id, future in futures.items()}
+    
+    for user_id, collected_data in user_data.items():
+        summary_dir = os.path.join(base_dir, user_id) if batch_mode else base_dir
+        build_user_history(user_id, collected_data, history_dir, summary_dir)
+
+def main(transport):
+    if not FILTER_AIR_YEAR_MONTH or not re.match(r'^\d{4}-\d{2}$', FILTER_AIR_YEAR_MONTH):
+        print("❌ 错误: 请在脚本中正确设置 FILTER_AIR_YEAR_MONTH (格式: YYYY-MM)。")
+        return
+
+    # 计算日期区间
+    start_date, end_date = get_date_range(FILTER_AIR_YEAR_MONTH)
+    print(f"📅 收藏日期筛选区间: {start_date.strftime('%Y-%m-%d')} ~ {end_date.strftime('%Y-%m-%d')}")
+    
+    # 单用户时保持原有目录结构；批量模式下每个用户一个子目录，海报统一缓存
+    base_dir = f"anime-evaluate-{FILTER_AIR_YEAR_MONTH}"
+    batch_mode = len(USER_IDS) > 1
+    if batch_mode:
+        poster_cache_dir = os.path.join(base_dir, "_poster_cache")
+    else:
+        poster_cache_dir = os.path.join(base_dir, "bgm_posters")
+    
+    setup_directory(base_dir)
+    setup_directory(poster_cache_dir)
+    
+    # 1. 所有用户并发爬取，共享连接池和限速器
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        futures = {user_id: executor.submit(crawl_user, transport, user_id, start_date, end_date) for user_id in USER_IDS}
+        user_data = {user_id: future.result() for user_id, future in futures.items()}
+    
+    # 2. 汇总所有用户的当季新番，按 subject_id 去重后只下载一次海报
+    unique_subjects = {}
+    for collected_data in user_data.values():
+        for item in collected_data:
+            if item['category'] == 'current_season':
+                unique_subjects.setdefault(item['subject_id'], item['title'])
+    
+    if unique_subjects:
+        print(f"\n🖼️ 开始为当季新番下载海报（去重后共 {len(unique_subjects)} 部）...")
+        poster_results = fetch_unique_posters(transport, unique_subjects, poster_cache_dir)
+    else:
+        print("\n⚠️ 没有当季新番需要下载海报。")
+        poster_results = {}
+    
+    # 3. 按用户分别生成输出
+    for user_id, collected_data in user_data.items():
+        output_dir = os.path.join(base_dir, user_id) if batch_mode else base_dir
+        build_user_report(user_id, collected_data, output_dir, poster_results)
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    with build_transport() as transport:
+        if RUN_MODE == 'history':
+            main_history(transport)
+        else:
+            main(transport)